@@ -8,33 +8,64 @@ Features:
 - Submenu: Sensitivity + DPI, Internal Settings (step-by-step), Lag Fix, In-game Settings,
            In-game Problems Fixing, Control Layout Suggestions, Save Profile, Load Profile
 - Uses internal DEVICES database for device-specific presets; fallback dynamic rules if device unknown
-- Profiles saved locally in 'profiles.json' per user_id
+- Profiles saved locally in 'profiles.jsonl' (append-only log) per user_id
 
 Requirements:
 - Python 3.9+
 - python-telegram-bot==20.3
+- orjson (optional, faster profile serialization)
+- numpy (optional, vectorized conversion of long cm/360 lists)
 
 Setup:
-1) pip install python-telegram-bot==20.3
+1) pip install python-telegram-bot==20.3 orjson numpy
 2) export TG_BOT_TOKEN="your_token_here"
    export BOT_PASSWORD="yourpass"   # optional
 3) python bot.py
 """
 
 import os
+import re
+import sys
+import hmac
 import json
-from typing import Dict, Any
+import functools
+import atexit
+import asyncio
+import logging
+import threading
+from types import MappingProxyType
+from typing import Dict, Any, Optional, BinaryIO, Mapping, List, Sequence
 from pathlib import Path
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to stdlib json
+    orjson = None
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, ContextTypes,
     CallbackQueryHandler, MessageHandler, filters
 )
 
+logger = logging.getLogger(__name__)
+
 # -------------------------
 # Configuration / DB
 # -------------------------
-PROFILES_FILE = Path("profiles.json")
+# Telegram bot token, read once at startup
+TG_BOT_TOKEN = os.environ.get("TG_BOT_TOKEN")
+
+# Unlock password, read once at startup (compared as bytes with hmac.compare_digest)
+BOT_PASSWORD = os.environ.get("BOT_PASSWORD", "1234").encode("utf-8")
+
+# Append-only JSON-Lines log: one {"uid": ..., "device": ..., "game": ...} per save
+PROFILES_LOG = Path("profiles.jsonl")
+# Pre-log format (a single {uid: entry} JSON dict); migrated once by load_profiles
+LEGACY_PROFILES_FILE = Path("profiles.json")
+
+# Number of records currently in the log (drives compaction)
+_PROFILES_LOG_LINES = 0
+# Append handle, opened lazily by save_profiles_one
+_PROFILES_LOG_FH: Optional[BinaryIO] = None
 
 # Minimal device DB (sample). You can expand this list as needed.
 # Structure:
@@ -44,6 +75,7 @@ PROFILES_FILE = Path("profiles.json")
 #    "internal_steps": [...],
 #    "lag_fix": [...]
 # }
+# "_internal_text" / "_lagfix_text" (the joined step lists) are added after the table.
 DEVICES: Dict[str, Dict[str, Any]] = {
     "poco x3": {
         "ram_gb": 6,
@@ -117,34 +149,330 @@ DEVICES: Dict[str, Dict[str, Any]] = {
 }
 
 SUPPORTED_GAMES = {
-    "game_freefire": "freefire",
-    "game_bgmi": "bgmi",
-    "game_cod": "cod"
+    "game_freefire": sys.intern("freefire"),
+    "game_bgmi": sys.intern("bgmi"),
+    "game_cod": sys.intern("cod")
 }
 
+# Name fragments used by dynamic_device_profile to guess a device's tier
+_LOW_END_HINTS = ("lite", "y", "entry", "c3", "a03")
+_HIGH_END_HINTS = ("pro", "plus", "max", "ultra", "9", "8", "7", "oneplus", "samsung s")
+
+# Game names recognised in free text, mapped (spaces removed) to SUPPORTED_GAMES values.
+# SUPPORTED_GAMES values are interned, so every stored 'selected_game' is too.
+# A bare "free" only breaks ties in favour of Free Fire; it never selects a game
+# on its own (see match_game).
+_GAME_RE = re.compile(r"(free ?fire|free|ff|bgmi|pubg|call of duty|cod)")
+_GAME_MAP = {
+    "freefire": SUPPORTED_GAMES["game_freefire"],
+    "free": SUPPORTED_GAMES["game_freefire"],
+    "ff": SUPPORTED_GAMES["game_freefire"],
+    "bgmi": SUPPORTED_GAMES["game_bgmi"],
+    "pubg": SUPPORTED_GAMES["game_bgmi"],
+    "callofduty": SUPPORTED_GAMES["game_cod"],
+    "cod": SUPPORTED_GAMES["game_cod"]
+}
+# When several games are named, the earliest here wins
+_GAME_PRIORITY = (SUPPORTED_GAMES["game_freefire"], SUPPORTED_GAMES["game_bgmi"], SUPPORTED_GAMES["game_cod"])
+
+# Problem descriptions are classified in one pass; each match's lastgroup names a
+# reply below, and when several kinds match the earliest in _PROBLEM_PRIORITY wins
+_PROBLEM_RE = re.compile(
+    r"(?P<lag>lag|fps|frame|stutter)"
+    r"|(?P<crash>crash|closing|force close|stopped)"
+    r"|(?P<auth>login|auth|account|ban)"
+)
+_PROBLEM_PRIORITY = ("lag", "crash", "auth")
+_PROBLEM_REPLIES = {
+    "lag": (
+        "Troubleshooting (lag/fps) for {device}:\n"
+        "1) Close background apps & clear cache.\n"
+        "2) Lower graphics, disable shadows and AA.\n"
+        "3) Use Wi-Fi or stable network; check ping.\n"
+        "4) Reboot and test; if overheating reduce session time.\n"
+    ),
+    "crash": (
+        "Troubleshooting (crash) for {device}:\n"
+        "1) Update the game & OS.\n"
+        "2) Clear game cache; reinstall if needed.\n"
+        "3) Ensure sufficient free storage and memory.\n"
+    ),
+    "auth": (
+        "Troubleshooting (login/account) for {device}:\n"
+        "1) Check network & server status.\n"
+        "2) Try reinstall or clear cache.\n"
+        "3) If linked to social login, check those credentials."
+    ),
+    "generic": (
+        "Generic troubleshooting:\n"
+        "- Update game & OS, clear cache.\n- Free up storage (>=2-5GB).\n- Lower graphics and test.\nIf you give a specific short description (e.g., 'fps drops after 10 min'), I'll provide targeted steps."
+    )
+}
+
+# Inline keyboards are identical for every user, so build them once
+START_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("1. Start", callback_data="start_main")],
+    [InlineKeyboardButton("2. Password", callback_data="password")],
+    [InlineKeyboardButton("3. Menu (Free Fire / BGMI / COD)", callback_data="menu_games")]
+])
+
+GAMES_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Free Fire", callback_data="game_freefire")],
+    [InlineKeyboardButton("BGMI", callback_data="game_bgmi")],
+    [InlineKeyboardButton("COD Mobile", callback_data="game_cod")],
+    [InlineKeyboardButton("Cancel", callback_data="cancel")]
+])
+
+# The submenu is the same for every device/game; only the message text varies
+SUBMENU_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Sensitivity + DPI", callback_data="sub_sensitivity")],
+    [InlineKeyboardButton("Internal Setting (step-by-step)", callback_data="sub_internal")],
+    [InlineKeyboardButton("Lag / Heating Fix", callback_data="sub_lagfix")],
+    [InlineKeyboardButton("In-game Settings", callback_data="sub_ingame")],
+    [InlineKeyboardButton("In-game Problems Fixing", callback_data="sub_problems")],
+    [InlineKeyboardButton("Control Layout Suggestions", callback_data="sub_controls")],
+    [InlineKeyboardButton("Save Profile", callback_data="sub_save_profile"),
+     InlineKeyboardButton("Load Profile", callback_data="sub_load_profile")],
+    [InlineKeyboardButton("Back to Games", callback_data="back_games")]
+])
+
+# Pre-join the step lists shown by the Internal Setting / Lag Fix submenus
+for _dev in DEVICES.values():
+    _dev["_internal_text"] = "\n".join(_dev["internal_steps"])
+    _dev["_lagfix_text"] = "\n".join(_dev["lag_fix"])
+del _dev
+
+# Lookup key used when no device has been entered yet ('Unknown device' normalized)
+UNKNOWN_DEVICE_KEY = "unknown device"
+
+# Read-only views of DEVICES, built once at import (see lookup_device)
+_DEVICES_FROZEN: Dict[str, Mapping[str, Any]] = {k: MappingProxyType(v) for k, v in DEVICES.items()}
+
 # -------------------------
 # Utilities
 # -------------------------
+if orjson is not None:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    _json_loads = json.loads
+
 def load_profiles() -> Dict[str, Any]:
-    if not PROFILES_FILE.exists():
-        return {}
+    """
+    Fold profiles.jsonl into a {uid: entry} dict (last write wins). Called once
+    by ProfileStore, which keeps the live view from then on.
+    """
+    global _PROFILES_LOG_LINES
+    if not PROFILES_LOG.exists() and LEGACY_PROFILES_FILE.exists():
+        _migrate_legacy_profiles()
+    profiles: Dict[str, Any] = {}
+    count = 0
     try:
-        return json.loads(PROFILES_FILE.read_text(encoding="utf-8"))
-    except Exception:
+        with PROFILES_LOG.open("rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = _json_loads(line)
+                    uid = rec.pop("uid")
+                except (ValueError, KeyError):
+                    # torn line from an interrupted write (save_profiles_one
+                    # newline-terminates it before appending); skip it
+                    continue
+                profiles[uid] = rec
+                count += 1
+    except OSError:
         return {}
+    _PROFILES_LOG_LINES = count
+    return profiles
 
-def save_profiles(profiles: Dict[str, Any]):
-    PROFILES_FILE.write_text(json.dumps(profiles, indent=2), encoding="utf-8")
+def _migrate_legacy_profiles():
+    """Fold an old profiles.json into the log, then move it out of the way."""
+    try:
+        legacy = _json_loads(LEGACY_PROFILES_FILE.read_bytes())
+    except (OSError, ValueError):
+        return
+    if not isinstance(legacy, dict):
+        return
+    compact_profiles(legacy)
+    LEGACY_PROFILES_FILE.rename(LEGACY_PROFILES_FILE.with_suffix(".json.migrated"))
+
+def save_profiles_one(uid: str, entry: Dict[str, Any]):
+    """Append a single profile record to the log."""
+    global _PROFILES_LOG_FH, _PROFILES_LOG_LINES
+    if _PROFILES_LOG_FH is None:
+        fh = PROFILES_LOG.open("a+b")
+        # terminate a torn last line (crash mid-append) so the next record
+        # starts on its own line instead of being glued onto the fragment
+        if fh.seek(0, os.SEEK_END) > 0:
+            fh.seek(-1, os.SEEK_END)
+            if fh.read(1) != b"\n":
+                fh.write(b"\n")
+        _PROFILES_LOG_FH = fh
+    _PROFILES_LOG_FH.write(_json_dumps({"uid": uid, **entry}) + b"\n")
+    _PROFILES_LOG_FH.flush()
+    _PROFILES_LOG_LINES += 1
+
+def compact_profiles(profiles: Dict[str, Any]):
+    """Rewrite the log with one record per user, dropping superseded lines."""
+    global _PROFILES_LOG_FH, _PROFILES_LOG_LINES
+    tmp = PROFILES_LOG.with_suffix(".jsonl.tmp")
+    with tmp.open("wb") as f:
+        for uid, entry in profiles.items():
+            f.write(_json_dumps({"uid": uid, **entry}) + b"\n")
+    if _PROFILES_LOG_FH is not None:
+        _PROFILES_LOG_FH.close()
+        _PROFILES_LOG_FH = None
+    os.replace(tmp, PROFILES_LOG)
+    _PROFILES_LOG_LINES = len(profiles)
+
+class ProfileStore:
+    """
+    Write-coalescing front for profiles.jsonl. set() only updates memory and
+    queues the record; a background task appends the queued records once after
+    `flush_delay` seconds, so a burst of saves results in a single write.
+    The log is compacted when it grows past twice the number of live profiles.
+    Flushes run one at a time and in order: each flush task waits for the
+    previous one, and _write holds a lock so the atexit flush cannot overlap.
+    """
+    def __init__(self, flush_delay: float = 0.5):
+        self.flush_delay = flush_delay
+        self._profiles: Optional[Dict[str, Any]] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending)
+
+    def _data(self) -> Dict[str, Any]:
+        if self._profiles is None:
+            self._profiles = load_profiles()
+        return self._profiles
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        return self._data().get(uid)
+
+    def set(self, uid: str, entry: Dict[str, Any]):
+        self._data()[uid] = entry
+        was_dirty = self.dirty
+        self._pending[uid] = entry
+        if was_dirty:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (e.g. called from a script): write through
+            self.flush()
+            return
+        self._flush_task = loop.create_task(self._flush_after(self.flush_delay, self._flush_task))
+
+    def _take_pending(self) -> Dict[str, Dict[str, Any]]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _requeue(self, pending: Dict[str, Dict[str, Any]]):
+        # put back records from a failed write without clobbering newer set()s
+        for uid, entry in pending.items():
+            self._pending.setdefault(uid, entry)
+
+    def _write(self, pending: Dict[str, Dict[str, Any]], live: Dict[str, Any]):
+        with self._write_lock:
+            for uid, entry in pending.items():
+                save_profiles_one(uid, entry)
+            if _PROFILES_LOG_LINES > 2 * len(live):
+                compact_profiles(live)
+
+    async def _flush_after(self, delay: float, previous: Optional[asyncio.Task]):
+        await asyncio.sleep(delay)
+        if previous is not None:
+            # let an in-flight write finish first so records land in order
+            await asyncio.wait([previous])
+        pending = self._take_pending()
+        if not pending:
+            return
+        try:
+            # snapshot so handlers can keep calling set() while the thread writes
+            await asyncio.to_thread(self._write, pending, dict(self._data()))
+        except Exception:
+            logger.exception("Writing %d profile(s) failed; retrying in %.1fs", len(pending), self.flush_delay)
+            was_dirty = self.dirty
+            self._requeue(pending)
+            # a set() during the write already scheduled the next flush
+            if not was_dirty:
+                self._flush_task = asyncio.get_running_loop().create_task(
+                    self._flush_after(self.flush_delay, asyncio.current_task()))
+
+    def flush(self):
+        """Synchronously write pending changes (used on shutdown)."""
+        pending = self._take_pending()
+        if not pending:
+            return
+        try:
+            self._write(pending, dict(self._data()))
+        except Exception:
+            logger.exception("Writing %d profile(s) failed", len(pending))
+            self._requeue(pending)
+
+store = ProfileStore()
+atexit.register(store.flush)
 
 def get_device_key(name: str) -> str:
     return name.strip().lower()
 
-def dynamic_device_profile(device_name: str) -> Dict[str, Any]:
+def match_game(text: str) -> Optional[str]:
+    """
+    Return the game key named in lower-cased `text`, or None. Scans once; if
+    several games are named, _GAME_PRIORITY decides.
+    """
+    found = {m.group(1).replace(" ", "") for m in _GAME_RE.finditer(text)}
+    if not found - {"free"}:
+        return None
+    return min((_GAME_MAP[k] for k in found), key=_GAME_PRIORITY.index)
+
+def normalize_game_key(game: Optional[str]) -> Optional[str]:
+    """
+    Lower-case and intern a game key once, as it is stored in user_data, so
+    handlers can use user_data['selected_game'] as-is.
+    """
+    return sys.intern(game.lower()) if game else game
+
+def set_device(user_data: Dict[str, Any], name: Optional[str]):
+    """
+    Store the device name in user_data along with its normalized lookup key, so
+    handlers read user_data['device_key'] instead of re-normalizing the name.
+    """
+    user_data['device'] = name
+    user_data['device_key'] = get_device_key(name) if name else None
+
+def user_device_key(user_data: Dict[str, Any]) -> str:
+    """Return the normalized device key stored by set_device (or the unknown-device key)."""
+    return user_data.get('device_key') or UNKNOWN_DEVICE_KEY
+
+def lookup_device(key: str) -> Mapping[str, Any]:
+    """
+    Return the DEVICES entry for a normalized device key (see get_device_key), or
+    the dynamic fallback profile if the device is unknown. Callers must treat the
+    result as read-only.
+    """
+    dev = _DEVICES_FROZEN.get(key)
+    if dev is None:
+        dev = _dynamic_profile(key)
+    return dev
+
+def dynamic_device_profile(device_name: str) -> Mapping[str, Any]:
     """
     Create a fallback device profile using simple heuristics (RAM & cpu_tier guesses).
-    No external sources used.
+    No external sources used. Results are cached per normalized name and returned
+    read-only.
     """
-    dn = device_name.lower()
+    return _dynamic_profile(get_device_key(device_name))
+
+@functools.lru_cache(maxsize=512)
+def _dynamic_profile(dn: str) -> Mapping[str, Any]:
     profile = {
         "ram_gb": 4,
         "cpu_tier": "mid",
@@ -153,10 +481,10 @@ def dynamic_device_profile(device_name: str) -> Dict[str, Any]:
         "lag_fix": []
     }
     # heuristic
-    if any(k in dn for k in ["lite", "y", "entry", "c3", "a03"]):
+    if any(k in dn for k in _LOW_END_HINTS):
         profile["ram_gb"] = 2
         profile["cpu_tier"] = "low"
-    elif any(k in dn for k in ["pro", "plus", "max", "ultra", "9", "8", "7", "oneplus", "samsung s"]):
+    elif any(k in dn for k in _HIGH_END_HINTS):
         profile["ram_gb"] = 8
         profile["cpu_tier"] = "high"
     else:
@@ -200,7 +528,9 @@ def dynamic_device_profile(device_name: str) -> Dict[str, Any]:
         "Use stable Wi-Fi and check ping.",
         "Lower in-game graphics and FPS if needed."
     ]
-    return profile
+    profile["_internal_text"] = "\n".join(profile["internal_steps"])
+    profile["_lagfix_text"] = "\n".join(profile["lag_fix"])
+    return MappingProxyType(profile)
 
 def cm360_to_sensitivity(cm360: float, dpi: int, game_scale: float = 0.022) -> float:
     """
@@ -212,16 +542,37 @@ def cm360_to_sensitivity(cm360: float, dpi: int, game_scale: float = 0.022) -> f
     sens = raw * game_scale
     return round(sens, 4)
 
+# Below this many values NumPy's per-call overhead outweighs the vectorized math
+_VEC_MIN_LEN = 32
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    # imported on first use so startup doesn't pay for NumPy
+    try:
+        import numpy
+    except ImportError:  # optional speedup; fall back to a Python loop
+        return None
+    return numpy
+
+def cm360_to_sensitivity_vec(cms: Sequence[float], dpi: int, game_scale: float = 0.022) -> List[float]:
+    """
+    cm360_to_sensitivity over a list of cm/360 values. Long lists are converted
+    in one vectorized NumPy pass; short ones (every built-in preset has three
+    values) and installs without NumPy use a plain loop, which is faster there.
+    """
+    np = _numpy() if len(cms) >= _VEC_MIN_LEN else None
+    if np is None:
+        return [cm360_to_sensitivity(c, dpi, game_scale) for c in cms]
+    inches = np.asarray(cms, dtype=np.float64) * 0.393701
+    with np.errstate(divide="ignore"):
+        raw = np.where(inches > 0, 360.0 / (inches * dpi), 0.0)
+    return np.round(raw * game_scale, 4).tolist()
+
 # -------------------------
 # Bot Handlers
 # -------------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    kb = [
-        [InlineKeyboardButton("1. Start", callback_data="start_main")],
-        [InlineKeyboardButton("2. Password", callback_data="password")],
-        [InlineKeyboardButton("3. Menu (Free Fire / BGMI / COD)", callback_data="menu_games")]
-    ]
-    await update.message.reply_text("🔥 Gaming Utility Bot ready. Choose:", reply_markup=InlineKeyboardMarkup(kb))
+    await update.message.reply_text("🔥 Gaming Utility Bot ready. Choose:", reply_markup=START_KB)
     return
 
 async def start_menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -240,13 +591,7 @@ async def start_menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if data == "menu_games":
-        kb = [
-            [InlineKeyboardButton("Free Fire", callback_data="game_freefire")],
-            [InlineKeyboardButton("BGMI", callback_data="game_bgmi")],
-            [InlineKeyboardButton("COD Mobile", callback_data="game_cod")],
-            [InlineKeyboardButton("Cancel", callback_data="cancel")]
-        ]
-        await query.edit_message_text("Choose a game:", reply_markup=InlineKeyboardMarkup(kb))
+        await query.edit_message_text("Choose a game:", reply_markup=GAMES_KB)
         return
 
 async def game_select_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -269,142 +614,132 @@ async def game_select_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data['awaiting_device'] = True
         return
 
-async def build_submenu_for_device(chat_id: int, user_data: Dict[str, Any]):
-    device = user_data.get('device', 'Unknown device')
-    game = user_data.get('selected_game', 'unknown').upper()
-    kb = [
-        [InlineKeyboardButton("Sensitivity + DPI", callback_data="sub_sensitivity")],
-        [InlineKeyboardButton("Internal Setting (step-by-step)", callback_data="sub_internal")],
-        [InlineKeyboardButton("Lag / Heating Fix", callback_data="sub_lagfix")],
-        [InlineKeyboardButton("In-game Settings", callback_data="sub_ingame")],
-        [InlineKeyboardButton("In-game Problems Fixing", callback_data="sub_problems")],
-        [InlineKeyboardButton("Control Layout Suggestions", callback_data="sub_controls")],
-        [InlineKeyboardButton("Save Profile", callback_data="sub_save_profile"),
-         InlineKeyboardButton("Load Profile", callback_data="sub_load_profile")],
-        [InlineKeyboardButton("Back to Games", callback_data="back_games")]
-    ]
-    return InlineKeyboardMarkup(kb)
-
-async def submenu_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    data = query.data
+# Submenu handlers, dispatched by callback_data through SUBMENU_HANDLERS.
+# Each takes the (already answered) CallbackQuery and the handler context.
+async def _handle_back_games(query, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text("Choose a game:", reply_markup=GAMES_KB)
+    # clear device & game in user_data if you want; keep for convenience
+    context.user_data.pop('device', None)
+    context.user_data.pop('device_key', None)
+    context.user_data.pop('selected_game', None)
+
+async def _handle_sensitivity(query, context: ContextTypes.DEFAULT_TYPE):
+    # ask DPI
+    await query.edit_message_text("Sensitivity selected.\nSend your DPI (e.g., 400 / 480 / 560):")
+    context.user_data['awaiting_dpi'] = True
+
+async def _handle_internal(query, context: ContextTypes.DEFAULT_TYPE):
+    # provide internal steps based on device DB or dynamic profile
     device = context.user_data.get('device', 'Unknown device')
-    game = context.user_data.get('selected_game', 'unknown').lower()
-
-    if data == "back_games":
-        kb = [
-            [InlineKeyboardButton("Free Fire", callback_data="game_freefire")],
-            [InlineKeyboardButton("BGMI", callback_data="game_bgmi")],
-            [InlineKeyboardButton("COD Mobile", callback_data="game_cod")],
-            [InlineKeyboardButton("Cancel", callback_data="cancel")]
-        ]
-        await query.edit_message_text("Choose a game:", reply_markup=InlineKeyboardMarkup(kb))
-        # clear device & game in user_data if you want; keep for convenience
-        context.user_data.pop('device', None)
-        context.user_data.pop('selected_game', None)
-        return
-
-    # Sensitivity flow
-    if data == "sub_sensitivity":
-        # ask DPI
-        await query.edit_message_text("Sensitivity selected.\nSend your DPI (e.g., 400 / 480 / 560):")
-        context.user_data['awaiting_dpi'] = True
-        return
-
-    if data == "sub_internal":
-        # provide internal steps based on device DB or dynamic profile
-        dev_key = get_device_key(device)
-        if dev_key in DEVICES:
-            steps = DEVICES[dev_key]['internal_steps']
-        else:
-            profile = dynamic_device_profile(device)
-            steps = profile['internal_steps']
-        text = f"Internal settings guide for {device}:\n\n" + "\n".join(steps)
-        await query.edit_message_text(text, reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
-        return
-
-    if data == "sub_lagfix":
-        dev_key = get_device_key(device)
-        if dev_key in DEVICES:
-            steps = DEVICES[dev_key]['lag_fix']
-        else:
-            profile = dynamic_device_profile(device)
-            steps = profile['lag_fix']
-        text = f"Lag/Heating Fix Checklist for {device}:\n\n" + "\n".join(steps)
-        await query.edit_message_text(text, reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
-        return
+    device_key = user_device_key(context.user_data)
+    text = f"Internal settings guide for {device}:\n\n{lookup_device(device_key)['_internal_text']}"
+    await query.edit_message_text(text, reply_markup=SUBMENU_KB)
 
-    if data == "sub_ingame":
-        dev_key = get_device_key(device)
-        if dev_key in DEVICES:
-            presets = DEVICES[dev_key]['presets'].get(game, {})
-        else:
-            profile = dynamic_device_profile(device)
-            presets = profile['presets'].get(game, {})
-        # pretty print
-        if presets:
-            text = f"In-game recommended settings for {device} ({game.upper()}):\n\n"
-            rec = presets.get('recommended_in_game', {})
-            for k, v in rec.items():
-                text += f"- {k.capitalize()}: {v}\n"
-            text += f"\nSuggested DPI: {presets.get('dpi')}\nSuggested cm/360 examples: {presets.get('cm360_suggested')}\n"
-        else:
-            text = f"No specific presets found for {device} / {game.upper()}. Using dynamic suggestions:\n"
-            profile = dynamic_device_profile(device)
-            p = profile['presets'].get(game, {})
-            text += f"- DPI: {p.get('dpi')}\n- Suggested cm/360: {p.get('cm360_suggested')}\n- Recommended Graphcis/FPS: {p.get('recommended_in_game')}\n"
-        await query.edit_message_text(text, reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
-        return
-
-    if data == "sub_problems":
-        await query.edit_message_text("Describe the in-game problem (e.g., 'lag after 10 minutes', 'crash on launch'):")
-        context.user_data['awaiting_problem'] = True
-        return
-
-    if data == "sub_controls":
-        # control layout suggestion
-        layout = control_layout_suggestions(game, device)
-        await query.edit_message_text(layout, reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
-        return
+async def _handle_lagfix(query, context: ContextTypes.DEFAULT_TYPE):
+    device = context.user_data.get('device', 'Unknown device')
+    device_key = user_device_key(context.user_data)
+    text = f"Lag/Heating Fix Checklist for {device}:\n\n{lookup_device(device_key)['_lagfix_text']}"
+    await query.edit_message_text(text, reply_markup=SUBMENU_KB)
 
-    if data == "sub_save_profile":
-        # save selected device + game to profiles file for user
-        uid = str(update.effective_user.id)
-        profiles = load_profiles()
-        entry = {
-            "device": context.user_data.get('device'),
-            "game": context.user_data.get('selected_game')
-        }
-        profiles[uid] = entry
-        save_profiles(profiles)
-        await query.edit_message_text(f"Profile saved for your account: {entry}", reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
-        return
+async def _handle_ingame(query, context: ContextTypes.DEFAULT_TYPE):
+    device = context.user_data.get('device', 'Unknown device')
+    device_key = user_device_key(context.user_data)
+    game = context.user_data.get('selected_game', 'unknown')
+    presets = lookup_device(device_key)['presets'].get(game, {})
+    # pretty print
+    if presets:
+        parts = [f"In-game recommended settings for {device} ({game.upper()}):", ""]
+        parts.extend(f"- {k.capitalize()}: {v}" for k, v in presets.get('recommended_in_game', {}).items())
+        parts.append(f"\nSuggested DPI: {presets.get('dpi')}")
+        parts.append(f"Suggested cm/360 examples: {presets.get('cm360_suggested')}\n")
+        text = "\n".join(parts)
+    else:
+        profile = dynamic_device_profile(device_key)
+        p = profile['presets'].get(game, {})
+        text = (
+            f"No specific presets found for {device} / {game.upper()}. Using dynamic suggestions:\n"
+            f"- DPI: {p.get('dpi')}\n- Suggested cm/360: {p.get('cm360_suggested')}\n- Recommended Graphcis/FPS: {p.get('recommended_in_game')}\n"
+        )
+    await query.edit_message_text(text, reply_markup=SUBMENU_KB)
+
+async def _handle_problems(query, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text("Describe the in-game problem (e.g., 'lag after 10 minutes', 'crash on launch'):")
+    context.user_data['awaiting_problem'] = True
+
+async def _handle_controls(query, context: ContextTypes.DEFAULT_TYPE):
+    # control layout suggestion
+    device_key = user_device_key(context.user_data)
+    game = context.user_data.get('selected_game', 'unknown')
+    layout = control_layout_suggestions(game, device_key)
+    await query.edit_message_text(layout, reply_markup=SUBMENU_KB)
+
+async def _handle_save_profile(query, context: ContextTypes.DEFAULT_TYPE):
+    # save selected device + game to profiles file for user
+    uid = str(query.from_user.id)
+    entry = {
+        "device": context.user_data.get('device'),
+        "game": context.user_data.get('selected_game')
+    }
+    store.set(uid, entry)
+    await query.edit_message_text(f"Profile saved for your account: {entry}", reply_markup=SUBMENU_KB)
+
+async def _handle_load_profile(query, context: ContextTypes.DEFAULT_TYPE):
+    uid = str(query.from_user.id)
+    entry = store.get(uid)
+    if entry is not None:
+        set_device(context.user_data, entry.get('device'))
+        context.user_data['selected_game'] = normalize_game_key(entry.get('game'))
+        await query.edit_message_text(f"Loaded profile: {entry}", reply_markup=SUBMENU_KB)
+    else:
+        await query.edit_message_text("No saved profile found. Use 'Save Profile' first.", reply_markup=SUBMENU_KB)
+
+SUBMENU_HANDLERS = {
+    "back_games": _handle_back_games,
+    "sub_sensitivity": _handle_sensitivity,
+    "sub_internal": _handle_internal,
+    "sub_lagfix": _handle_lagfix,
+    "sub_ingame": _handle_ingame,
+    "sub_problems": _handle_problems,
+    "sub_controls": _handle_controls,
+    "sub_save_profile": _handle_save_profile,
+    "sub_load_profile": _handle_load_profile
+}
 
-    if data == "sub_load_profile":
-        uid = str(update.effective_user.id)
-        profiles = load_profiles()
-        if uid in profiles:
-            entry = profiles[uid]
-            context.user_data['device'] = entry.get('device')
-            context.user_data['selected_game'] = entry.get('game')
-            await query.edit_message_text(f"Loaded profile: {entry}", reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
-        else:
-            await query.edit_message_text("No saved profile found. Use 'Save Profile' first.", reply_markup=await build_submenu_for_device(update.effective_chat.id, context.user_data))
+async def submenu_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    handler = SUBMENU_HANDLERS.get(query.data)
+    if handler:
+        await handler(query, context)
         return
 
     # unknown
     await query.edit_message_text("Unknown submenu option. Use /start to begin.")
 
+# callback_data -> router. Exact keys are tried first, then the "<prefix>_" key.
+_CB_TABLE = {
+    "start_main": start_menu_router,
+    "password": start_menu_router,
+    "menu_games": start_menu_router,
+    "cancel": game_select_router,
+    "game_": game_select_router,
+    "back_games": submenu_router,
+    "sub_": submenu_router
+}
+
+async def _dispatch_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = update.callback_query.data or ""
+    handler = _CB_TABLE.get(data) or _CB_TABLE.get(data.partition("_")[0] + "_")
+    if handler:
+        await handler(update, context)
+
 async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     txt = update.message.text.strip()
-    uid = str(update.effective_user.id)
 
     # Password attempt
     if context.user_data.get('awaiting_password'):
         context.user_data['awaiting_password'] = False
-        password = os.environ.get("BOT_PASSWORD", "1234")
-        if txt == password:
+        if hmac.compare_digest(txt.encode("utf-8"), BOT_PASSWORD):
             context.user_data['unlocked'] = True
             await update.message.reply_text("✅ Password correct. Advanced features unlocked!")
         else:
@@ -415,10 +750,9 @@ async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TY
     if context.user_data.get('awaiting_device'):
         context.user_data['awaiting_device'] = False
         device_name = txt
-        context.user_data['device'] = device_name
+        set_device(context.user_data, device_name)
         # Build submenu
-        markup = await build_submenu_for_device(update.effective_chat.id, context.user_data)
-        await update.message.reply_text(f"Got device: {device_name}\nNow choose an option:", reply_markup=markup)
+        await update.message.reply_text(f"Got device: {device_name}\nNow choose an option:", reply_markup=SUBMENU_KB)
         return
 
     # DPI awaiting
@@ -438,19 +772,15 @@ async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TY
         txt_low = txt.lower()
         dpi = context.user_data.get('dpi', 480)
         device = context.user_data.get('device', 'Unknown device')
-        game = context.user_data.get('selected_game', 'unknown').upper()
+        game = context.user_data.get('selected_game', 'unknown')
         context.user_data['awaiting_cm360'] = False
 
         if txt_low == "default":
-            dev_key = get_device_key(device)
-            if dev_key in DEVICES:
-                suggestions = DEVICES[dev_key]['presets'].get(game.lower(), {}).get('cm360_suggested', [])
-            else:
-                suggestions = dynamic_device_profile(device)['presets'].get(game.lower(), {}).get('cm360_suggested', [])
-            reply = f"Suggested cm/360 for {device} ({game}): {suggestions}\n\nExamples with DPI={dpi}:\n"
-            for c in suggestions:
-                s = cm360_to_sensitivity(c, dpi)
-                reply += f"- {c} cm/360 -> sensitivity ≈ {s}\n"
+            device_key = user_device_key(context.user_data)
+            suggestions = lookup_device(device_key)['presets'].get(game, {}).get('cm360_suggested', [])
+            reply = f"Suggested cm/360 for {device} ({game.upper()}): {suggestions}\n\nExamples with DPI={dpi}:\n"
+            sens = cm360_to_sensitivity_vec(suggestions, dpi)
+            reply += "".join(f"- {c} cm/360 -> sensitivity ≈ {s}\n" for c, s in zip(suggestions, sens))
             await update.message.reply_text(reply)
             return
         else:
@@ -458,7 +788,7 @@ async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TY
                 cm360 = float(txt)
                 sens = cm360_to_sensitivity(cm360, dpi)
                 reply = (
-                    f"Device: {device}\nGame: {game}\nDPI: {dpi}\ncm/360: {cm360}\n\n"
+                    f"Device: {device}\nGame: {game.upper()}\nDPI: {dpi}\ncm/360: {cm360}\n\n"
                     f"Approx. suggested in-game sensitivity: {sens}\n\n"
                     "Note: This is an approximation. Fine-tune in small increments (0.01 - 0.1) in-game."
                 )
@@ -475,43 +805,18 @@ async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TY
         desc = txt.lower()
         device = context.user_data.get('device', 'Unknown device')
         # Very simple heuristic-based troubleshooting
-        if any(k in desc for k in ["lag", "fps", "frame", "stutter"]):
-            reply = (
-                f"Troubleshooting (lag/fps) for {device}:\n"
-                "1) Close background apps & clear cache.\n"
-                "2) Lower graphics, disable shadows and AA.\n"
-                "3) Use Wi-Fi or stable network; check ping.\n"
-                "4) Reboot and test; if overheating reduce session time.\n"
-            )
-        elif any(k in desc for k in ["crash", "closing", "force close", "stopped"]):
-            reply = (
-                f"Troubleshooting (crash) for {device}:\n"
-                "1) Update the game & OS.\n"
-                "2) Clear game cache; reinstall if needed.\n"
-                "3) Ensure sufficient free storage and memory.\n"
-            )
-        elif any(k in desc for k in ["login", "auth", "account", "ban"]):
-            reply = (
-                f"Troubleshooting (login/account) for {device}:\n"
-                "1) Check network & server status.\n"
-                "2) Try reinstall or clear cache.\n"
-                "3) If linked to social login, check those credentials."
-            )
-        else:
-            reply = (
-                "Generic troubleshooting:\n"
-                "- Update game & OS, clear cache.\n- Free up storage (>=2-5GB).\n- Lower graphics and test.\nIf you give a specific short description (e.g., 'fps drops after 10 min'), I'll provide targeted steps."
-            )
+        kinds = {m.lastgroup for m in _PROBLEM_RE.finditer(desc)}
+        kind = min(kinds, key=_PROBLEM_PRIORITY.index) if kinds else "generic"
+        reply = _PROBLEM_REPLIES[kind].format(device=device)
         await update.message.reply_text(reply)
         return
 
     # profile-related quick commands
     if txt.lower().startswith("load profile"):
-        profiles = load_profiles()
-        if uid in profiles:
-            p = profiles[uid]
-            context.user_data['device'] = p.get('device')
-            context.user_data['selected_game'] = p.get('game')
+        p = store.get(str(update.effective_user.id))
+        if p is not None:
+            set_device(context.user_data, p.get('device'))
+            context.user_data['selected_game'] = normalize_game_key(p.get('game'))
             await update.message.reply_text(f"Loaded profile: {p}")
         else:
             await update.message.reply_text("No saved profile found. Use Save Profile in submenu.")
@@ -522,15 +827,9 @@ async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     # If user types a game name directly
-    lowered = txt.lower()
-    if any(k in lowered for k in ["free fire", "freefire", "ff", "bgmi", "pubg", "cod", "call of duty"]):
-        # normalize
-        if "free" in lowered or "freefire" in lowered or "ff" in lowered:
-            context.user_data['selected_game'] = "freefire"
-        elif "bgmi" in lowered or "pubg" in lowered:
-            context.user_data['selected_game'] = "bgmi"
-        elif "cod" in lowered or "call of duty" in lowered:
-            context.user_data['selected_game'] = "cod"
+    game_key = match_game(txt.lower())
+    if game_key:
+        context.user_data['selected_game'] = game_key
         await update.message.reply_text(f"Selected {context.user_data['selected_game'].upper()}. Now send your device model (e.g., 'Poco X3'):")
         context.user_data['awaiting_device'] = True
         return
@@ -541,62 +840,66 @@ async def universal_text_router(update: Update, context: ContextTypes.DEFAULT_TY
 # -------------------------
 # Control layout helper
 # -------------------------
-def control_layout_suggestions(game: str, device: str) -> str:
-    g = game.lower()
-    base = ""
-    if "freefire" in g or "free fire" in g or "ff" in g:
-        base = (
-            "Free Fire — Suggested control layout:\n"
-            "- Move: Left thumb bottom-left\n"
-            "- Aim: Right thumb near center-right\n"
-            "- Fire (ADS): Top-right (near right thumb)\n"
-            "- Jump/Crouch/Prone: Lower-right cluster\n"
-            "- Tip: Use slightly transparent fire button so crosshair remains visible."
-        )
-    elif "bgmi" in g or "pubg" in g:
-        base = (
-            "BGMI/PUBG — Suggested control layout:\n"
-            "- Move: Left bottom\n"
-            "- Aim: Right center\n"
-            "- Fire: Right edge (use two-fire buttons for flexibility)\n"
-            "- Crouch/Prone/Jump: Lower-right cluster\n"
-            "- Tip: Enable gyroscope for fine aim if comfortable."
-        )
-    elif "cod" in g or "call of duty" in g:
-        base = (
-            "COD Mobile — Suggested control layout:\n"
-            "- Move: Left bottom\n"
-            "- Aim: Right center\n"
-            "- Fire: Right edge (primary)\n"
-            "- Secondary fire/ADS: small button near right thumb\n"
-            "- Tip: Use tap-to-ADS or hold-to-ADS based on personal preference."
-        )
-    else:
-        base = "Default FPS layout: Move left, aim + fire on right. Customize by feel."
-    # device hint
-    if "iphone" in device.lower():
-        base += "\n\nDevice hint: on iPhone, buttons can be slightly smaller due to high touch accuracy."
-    else:
-        base += "\n\nDevice hint: On large screens, keep primary fire slightly inward for comfortable reach."
-    return base
+_LAYOUT_BASE = {
+    "freefire": (
+        "Free Fire — Suggested control layout:\n"
+        "- Move: Left thumb bottom-left\n"
+        "- Aim: Right thumb near center-right\n"
+        "- Fire (ADS): Top-right (near right thumb)\n"
+        "- Jump/Crouch/Prone: Lower-right cluster\n"
+        "- Tip: Use slightly transparent fire button so crosshair remains visible."
+    ),
+    "bgmi": (
+        "BGMI/PUBG — Suggested control layout:\n"
+        "- Move: Left bottom\n"
+        "- Aim: Right center\n"
+        "- Fire: Right edge (use two-fire buttons for flexibility)\n"
+        "- Crouch/Prone/Jump: Lower-right cluster\n"
+        "- Tip: Enable gyroscope for fine aim if comfortable."
+    ),
+    "cod": (
+        "COD Mobile — Suggested control layout:\n"
+        "- Move: Left bottom\n"
+        "- Aim: Right center\n"
+        "- Fire: Right edge (primary)\n"
+        "- Secondary fire/ADS: small button near right thumb\n"
+        "- Tip: Use tap-to-ADS or hold-to-ADS based on personal preference."
+    ),
+    "default": "Default FPS layout: Move left, aim + fire on right. Customize by feel."
+}
+
+_LAYOUT_DEVICE_HINT = {
+    True: "\n\nDevice hint: on iPhone, buttons can be slightly smaller due to high touch accuracy.",
+    False: "\n\nDevice hint: On large screens, keep primary fire slightly inward for comfortable reach."
+}
+
+# Every (game family, is_iphone) combination, joined once at import
+_LAYOUTS = {
+    (g, is_iphone): base + hint
+    for g, base in _LAYOUT_BASE.items()
+    for is_iphone, hint in _LAYOUT_DEVICE_HINT.items()
+}
+
+def control_layout_suggestions(game: str, device_key: str) -> str:
+    # `game` and `device_key` are the normalized keys from user_data
+    # (see normalize_game_key / set_device)
+    key = match_game(game) or "default"
+    return _LAYOUTS[(key, "iphone" in device_key)]
 
 # -------------------------
 # Startup
 # -------------------------
 def main():
-    token = os.environ.get("8582595837:AAFm0YVXPYPFVWiuS6AP1ax2Ud7VeG8OX2U")
-    if not token:
+    if not TG_BOT_TOKEN:
         print("Error: set TG_BOT_TOKEN environment variable and rerun.")
         return
 
-    app = ApplicationBuilder().token(token).build()
+    app = ApplicationBuilder().token(TG_BOT_TOKEN).build()
 
     # Commands
     app.add_handler(CommandHandler("start", start))
-    # CallbackQuery handlers
-    app.add_handler(CallbackQueryHandler(start_menu_router, pattern="^(start_main|password|menu_games)$"))
-    app.add_handler(CallbackQueryHandler(game_select_router, pattern="^game_"))
-    app.add_handler(CallbackQueryHandler(submenu_router, pattern="^(sub_|back_games|cancel|sub_save_profile|sub_load_profile)$"))
+    # CallbackQuery handler (routes by callback_data, see _CB_TABLE)
+    app.add_handler(CallbackQueryHandler(_dispatch_cb))
 
     # Universal text handler for device / dpi / problems / password
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, universal_text_router))